@@ -1,19 +1,88 @@
 """相機分析模式：即時分析相機畫面中的卡片"""
 
 import cv2
-import time
+import logging
 import numpy as np
-from typing import List, Tuple, Dict
-from threading import Thread, Lock
-from queue import Queue
-from .utils import CardMatcher
+from typing import List, Tuple, Optional
+from threading import Thread, Condition
+from queue import Queue, Empty, Full
+from .utils import CardMatcher, draw_text
 from .cv_detector import CVCardDetector
 
+logger = logging.getLogger(__name__)
+
+class _CaptureThread(Thread):
+    """相機擷取線程：持續 grab 以丟棄舊畫面，只在有人需要時才解碼"""
+    
+    def __init__(self, cap: cv2.VideoCapture):
+        """初始化擷取線程
+        
+        Args:
+            cap: 已開啟的相機
+        """
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.is_running = True
+        self._condition = Condition()
+        self._wanted = False        # 是否有消費者在等待新畫面
+        self._latest_frame = None
+    
+    def run(self) -> None:
+        """擷取迴圈，所有 VideoCapture 操作都在這個線程中進行"""
+        while self.is_running:
+            if not self.cap.grab():
+                print("無法讀取相機畫面")
+                break
+            
+            # 沒有消費者等待時跳過解碼
+            if not self._wanted:
+                continue
+            
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                continue
+            with self._condition:
+                self._latest_frame = frame
+                self._wanted = False
+                self._condition.notify_all()
+        
+        with self._condition:
+            self.is_running = False
+            self._condition.notify_all()
+    
+    def read(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """等待並取得下一個解碼後的畫面
+        
+        Args:
+            timeout: 最長等待秒數，None 表示一直等待
+            
+        Returns:
+            影像幀，逾時或擷取已停止時回傳 None
+        """
+        with self._condition:
+            self._wanted = True
+            self._condition.wait_for(lambda: not self._wanted or not self.is_running, timeout)
+            if self._wanted:
+                return None
+            frame, self._latest_frame = self._latest_frame, None
+            return frame
+    
+    def stop(self) -> None:
+        """停止擷取"""
+        with self._condition:
+            self.is_running = False
+            self._condition.notify_all()
+
 class CameraAnalyzer(CardMatcher):
     """相機分析器類"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, use_flann: bool = False):
+        """初始化相機分析器
+        
+        Args:
+            use_flann: 是否使用 FLANN LSH 索引進行近似搜尋，傳給 CardMatcher
+        """
+        super().__init__(use_flann=use_flann)
         # 初始化 OpenCV 檢測器
         self.detector = CVCardDetector(
             min_area=20000,        # 最小面積
@@ -23,52 +92,115 @@ class CameraAnalyzer(CardMatcher):
         )
         self.display_height = 480  # 顯示高度
         self.ref_width = 200      # 參考卡片寬度
-        self.current_matches = []  # 當前的匹配結果
-        self.matches_lock = Lock() # 用於保護匹配結果的鎖
-        self.processing_queue = Queue(maxsize=1)  # 處理隊列
+        self.max_ref_display = 5  # 最多顯示的參考卡片數量
+        self._canvas = None       # 預先配置的顯示畫布，依主畫面寬度建立
+        # 當前的匹配結果：比對線程每次換上新的 tuple，單一屬性賦值是原子操作，讀取時不需要鎖
+        self._matches_snapshot: tuple = ()
+        self.result_queue = Queue(maxsize=2)      # 檢測 -> 顯示
+        self.processing_queue = Queue(maxsize=1)  # 檢測 -> 比對
         self.is_running = False
+        self.scene_change_threshold = 2.0  # 畫面指紋的平均灰階差異閾值
+        self._last_signature = None        # 最後一次送去比對的畫面指紋
+    
+    def detection_worker(self, capture: _CaptureThread) -> None:
+        """卡片檢測工作線程
+        
+        Args:
+            capture: 相機擷取線程
+        """
+        while self.is_running:
+            # 向擷取線程要求最新的影像幀
+            raw_frame = capture.read(timeout=0.1)
+            if raw_frame is None:
+                if not capture.is_running:
+                    self.is_running = False
+                continue
+            
+            frame, detections = self.detect_frame(raw_frame)
+            self._put_latest(self.result_queue, (raw_frame, frame, detections))
     
     def matching_worker(self):
         """卡片比對工作線程"""
         while self.is_running:
             try:
-                # 非阻塞式獲取最新的檢測結果
-                detections_with_images = self.processing_queue.get_nowait()
+                # 阻塞式等待最新的檢測結果，逾時後重新檢查是否仍在運行
+                detections_with_images = self.processing_queue.get(timeout=0.1)
+            except Empty:
+                continue
+            
+            try:
                 new_matches = []
                 
                 # 處理每個檢測結果
                 for card_image, detection in detections_with_images:
-                    card_matches = self.find_matches(card_image)
+                    card_matches = self.find_matches(card_image, top_k=1)
                     if card_matches:
                         new_matches.append((card_matches[0], detection))
                 
                 # 更新匹配結果
-                with self.matches_lock:
-                    self.current_matches = new_matches
-                
+                self._matches_snapshot = tuple(new_matches)
+            except Exception as e:
+                logger.error("卡片比對失敗：%s", e)
+            finally:
                 self.processing_queue.task_done()
-            except:
-                # 如果隊列為空，短暫休眠
-                time.sleep(0.01)
     
-    def process_frame(self, frame: np.ndarray) -> np.ndarray:
-        """處理單一影像幀
+    @staticmethod
+    def _put_latest(queue: Queue, item) -> None:
+        """放入隊列，隊列已滿時丟棄最舊的項目，讓消費者總是拿到最新的資料
+        
+        Args:
+            queue: 目標隊列
+            item: 要放入的項目
+        """
+        while True:
+            try:
+                queue.put_nowait(item)
+                return
+            except Full:
+                try:
+                    queue.get_nowait()
+                    queue.task_done()
+                except Empty:
+                    pass
+    
+    @staticmethod
+    def _frame_signature(frame: np.ndarray) -> np.ndarray:
+        """計算畫面指紋：縮小為 16x16 的灰階圖
         
         Args:
             frame: 原始影像幀
             
         Returns:
-            處理後的影像幀
+            int16 格式的指紋，方便直接相減比較
+        """
+        small = cv2.resize(frame, (16, 16), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+    
+    def detect_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, List[Tuple[Tuple[int, int, int, int], float]]]:
+        """調整影像幀大小並檢測卡片，檢測到的卡片會送往比對線程
+        
+        Args:
+            frame: 原始影像幀
+            
+        Returns:
+            調整大小後的影像幀和檢測結果列表
         """
+        # 先計算畫面指紋，畫面沒有變化時不需要重新比對
+        signature = self._frame_signature(frame)
+        scene_changed = (self._last_signature is None or
+                         np.mean(np.abs(signature - self._last_signature)) > self.scene_change_threshold)
+        
         # 調整主畫面大小
-        h, w = frame.shape[:2]
-        scale = self.display_height / h
-        main_width = int(w * scale)
-        frame = cv2.resize(frame, (main_width, self.display_height))
+        frame = self.resize_image(frame)
         
         # 檢測卡片
         detections = self.detector.detect(frame)
-        print(f"[CameraAnalyzer] 檢測到 {len(detections)} 個卡片")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("檢測到 %d 個卡片", len(detections))
+        
+        if not scene_changed:
+            return frame, detections
         
         # 準備檢測結果和對應的圖像
         detections_with_images = []
@@ -78,77 +210,110 @@ class CameraAnalyzer(CardMatcher):
             try:
                 card_image = frame[y1:y2, x1:x2]
                 if card_image.size == 0:
-                    print(f"[CameraAnalyzer] 警告：卡片 {i} 區域為空")
+                    logger.warning("卡片 %d 區域為空", i)
                     continue
                 detections_with_images.append((card_image, (i, bbox, conf)))
-                print(f"[CameraAnalyzer] 成功提取卡片 {i} 圖像，大小：{card_image.shape}")
+                if debug:
+                    logger.debug("成功提取卡片 %d 圖像，大小：%s", i, card_image.shape)
             except Exception as e:
-                print(f"[CameraAnalyzer] 錯誤：提取卡片 {i} 圖像失敗：{str(e)}")
+                logger.error("提取卡片 %d 圖像失敗：%s", i, e)
         
-        # 如果處理隊列未滿，添加新的檢測結果
-        try:
-            if detections_with_images:
-                self.processing_queue.put_nowait(detections_with_images)
-                print(f"[CameraAnalyzer] 將 {len(detections_with_images)} 個卡片加入處理隊列")
-        except:
-            print("[CameraAnalyzer] 處理隊列已滿，跳過當前幀")
+        # 將最新的檢測結果放入處理隊列，取代尚未處理的舊結果
+        if detections_with_images:
+            self._put_latest(self.processing_queue, detections_with_images)
+            self._last_signature = signature
+            if debug:
+                logger.debug("將 %d 個卡片加入處理隊列", len(detections_with_images))
+        
+        return frame, detections
+    
+    def _get_canvas(self, main_width: int) -> np.ndarray:
+        """取得可容納主畫面和最多參考卡片的顯示畫布，只在主畫面寬度改變時重新配置
+        
+        Args:
+            main_width: 主畫面寬度
+            
+        Returns:
+            顯示畫布，內容為上一幀的殘留資料
+        """
+        shape = (self.display_height, main_width + self.max_ref_display * self.ref_width, 3)
+        if self._canvas is None or self._canvas.shape != shape:
+            self._canvas = np.empty(shape, dtype=np.uint8)
+        return self._canvas
+    
+    def render_frame(self, frame: np.ndarray,
+                     detections: List[Tuple[Tuple[int, int, int, int], float]]) -> np.ndarray:
+        """在影像幀上繪製檢測與當前的匹配結果
+        
+        Args:
+            frame: 調整大小後的影像幀
+            detections: 檢測結果列表
+            
+        Returns:
+            用於顯示的影像，可能是共用畫布的一部分，下一次呼叫時會被覆寫
+        """
+        main_width = frame.shape[1]
         
-        # 在原圖上標註檢測結果
-        current_matches = []
-        with self.matches_lock:
-            current_matches = self.current_matches.copy()
-        print(f"[CameraAnalyzer] 當前有 {len(current_matches)} 個匹配結果")
+        # 取得匹配結果的快照，不需要鎖也不必複製
+        current_matches = self._matches_snapshot
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("當前有 %d 個匹配結果", len(current_matches))
         
-        # 創建除錯圖像
-        debug_frame = self.detector.draw_debug(frame, detections)
+        # 計算總寬度，並使用預先配置的畫布（最多顯示5張參考卡片）
+        ref_matches = current_matches[:self.max_ref_display]
+        total_width = main_width + len(ref_matches) * self.ref_width
+        display = self._get_canvas(main_width)[:, :total_width]
+        
+        # 將主畫面複製到畫布上並直接繪製除錯資訊；
+        # 原始影像幀不能直接繪製，因為比對線程仍在使用它的卡片區域
+        debug_frame = self.detector.draw_debug(frame, detections, out=display[:, :main_width])
         
         # 繪製匹配結果
         for (card_id, score), (i, (x1, y1, x2, y2), conf) in current_matches:
             # 在框上方顯示匹配信息
             text = f'Match: {score:.1f}%'
-            cv2.putText(debug_frame, text, (x1, y1-10),
-                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            print(f"[CameraAnalyzer] 卡片 {i} 匹配結果：ID={card_id}, 分數={score:.1f}%")
+            draw_text(debug_frame, text, (x1, y1-10), 0.5, (0, 255, 0), 2)
+            if debug:
+                logger.debug("卡片 %d 匹配結果：ID=%s, 分數=%.1f%%", i, card_id, score)
         
         # 如果有匹配結果，在右側顯示參考卡片
-        if current_matches:
-            # 最多顯示5張參考卡片
-            current_matches = current_matches[:5]
-            
-            # 計算總寬度
-            total_width = main_width + len(current_matches) * self.ref_width
-            display = np.zeros((self.display_height, total_width, 3), dtype=np.uint8)
-            
-            # 放置主畫面
-            display[:, :main_width] = debug_frame
-            
-            # 放置參考卡片
-            x_offset = main_width
-            for (card_id, score), _ in current_matches:
-                card_info = self.get_card_info(card_id)
-                if card_info and 'img' in card_info:
-                    # 調整參考卡片大小
-                    ref_img = card_info['img']
-                    h, w = ref_img.shape[:2]
-                    scale = self.ref_width / w
-                    ref_height = int(h * scale)
-                    ref_img = cv2.resize(ref_img, (self.ref_width, ref_height))
-                    
-                    # 添加匹配分數
-                    score_text = f"{score:.1f}%"
-                    cv2.putText(ref_img, score_text, 
-                              (5, ref_height - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                              (0, 255, 0), 2)
-                    
-                    # 垂直居中放置
-                    y_offset = (self.display_height - ref_height) // 2
-                    display[y_offset:y_offset+ref_height, x_offset:x_offset+self.ref_width] = ref_img
-                    x_offset += self.ref_width
-            
-            return display
+        x_offset = main_width
+        for (card_id, score), _ in ref_matches:
+            # 使用快取的縮圖，不在每一幀重新縮放
+            ref_img = self.get_card_thumbnail(card_id, width=self.ref_width)
+            if ref_img is not None:
+                ref_height = ref_img.shape[0]
+                
+                # 垂直居中放置，只清除卡片上下的空白區域
+                y_offset = (self.display_height - ref_height) // 2
+                column = display[:, x_offset:x_offset+self.ref_width]
+                column[:y_offset] = 0
+                column[y_offset:y_offset+ref_height] = ref_img
+                column[y_offset+ref_height:] = 0
+                
+                # 添加匹配分數
+                score_text = f"{score:.1f}%"
+                draw_text(display, score_text,
+                          (x_offset + 5, y_offset + ref_height - 10),
+                          0.5, (0, 255, 0), 2)
+                x_offset += self.ref_width
         
-        return debug_frame
+        # 清除沒有放置卡片的剩餘區域
+        display[:, x_offset:] = 0
+        return display
+    
+    def process_frame(self, frame: np.ndarray) -> np.ndarray:
+        """處理單一影像幀
+        
+        Args:
+            frame: 原始影像幀
+            
+        Returns:
+            處理後的影像幀
+        """
+        frame, detections = self.detect_frame(frame)
+        return self.render_frame(frame, detections)
     
     def run_camera(self, camera_id: int = 0) -> None:
         """運行相機分析模式
@@ -162,26 +327,33 @@ class CameraAnalyzer(CardMatcher):
         if not cap.isOpened():
             print(f"無法開啟相機 {camera_id}")
             return
+        
+        # 只保留最新的一幀，避免驅動程式累積舊畫面造成延遲
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             
         print("\n按 'q' 鍵退出")
         print("按 's' 鍵儲存當前畫面")
         
-        # 啟動比對工作線程
+        # 啟動擷取、檢測和比對工作線程，主線程只負責顯示
         self.is_running = True
-        matching_thread = Thread(target=self.matching_worker, daemon=True)
-        matching_thread.start()
+        capture = _CaptureThread(cap)
+        workers = [
+            capture,
+            Thread(target=self.detection_worker, args=(capture,), daemon=True),
+            Thread(target=self.matching_worker, daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
         
         try:
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    print("無法讀取相機畫面")
-                    break
-                
-                # 處理當前幀
-                display = self.process_frame(frame)
+            while self.is_running:
+                try:
+                    raw_frame, frame, detections = self.result_queue.get(timeout=0.1)
+                except Empty:
+                    continue
                 
-                # 顯示結果
+                # 繪製並顯示結果
+                display = self.render_frame(frame, detections)
                 cv2.imshow('Card Detection', display)
                 
                 # 檢查按鍵
@@ -191,11 +363,13 @@ class CameraAnalyzer(CardMatcher):
                     break
                 elif key == ord('s'):
                     # 儲存當前畫面
-                    cv2.imwrite('camera_capture.jpg', frame)
+                    cv2.imwrite('camera_capture.jpg', raw_frame)
                     print("已儲存當前畫面")
         finally:
             # 清理資源
             self.is_running = False
-            matching_thread.join(timeout=1.0)
+            capture.stop()
+            for worker in workers:
+                worker.join(timeout=1.0)
             cap.release()
             cv2.destroyAllWindows()
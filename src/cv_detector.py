@@ -1,14 +1,22 @@
 """OpenCV 卡片檢測器：使用傳統電腦視覺方法進行矩形檢測"""
 
 import cv2
+import logging
 import numpy as np
-from typing import List, Tuple
+from typing import List, Tuple, Optional
+from .utils import draw_text
+
+logger = logging.getLogger(__name__)
 
 class CVCardDetector:
     """使用 OpenCV 的卡片檢測器"""
     
+    THRESHOLD_C = 2  # 自適應二值化從加權平均值減去的常數
+    
     def __init__(self, min_area: float = 2000, max_area: float = 200000,
-                 min_aspect_ratio: float = 0.5, max_aspect_ratio: float = 0.9):
+                 min_aspect_ratio: float = 0.5, max_aspect_ratio: float = 0.9,
+                 detect_scale: float = 0.5, use_cuda: bool = True, use_opencl: bool = True,
+                 motion_threshold: float = 1.0):
         """初始化檢測器
         
         Args:
@@ -16,82 +24,188 @@ class CVCardDetector:
             max_area: 最大矩形面積，用於過濾大物體
             min_aspect_ratio: 最小寬高比（寬/高）
             max_aspect_ratio: 最大寬高比（寬/高）
+            detect_scale: 檢測時的縮小比例，面積以原圖為準
+            use_cuda: 有可用的 CUDA 裝置時，是否在 GPU 上進行預處理
+            use_opencl: 沒有使用 CUDA 且有可用的 OpenCL 裝置時，是否透過 UMat 進行預處理
+            motion_threshold: 與上次檢測的畫面相比，平均每個像素的灰階差異低於此值時
+                直接沿用上次的檢測結果；設為0則停用
         """
         self.min_area = min_area
         self.max_area = max_area
         self.min_aspect_ratio = min_aspect_ratio
         self.max_aspect_ratio = max_aspect_ratio
+        self.detect_scale = detect_scale
+        self.motion_threshold = motion_threshold
+        
+        # 上次實際執行檢測時的灰階圖和檢測結果
+        self._prev_gray = None
+        self._cached_detections: List[Tuple[Tuple[int, int, int, int], float]] = []
+        
+        # 依縮小比例調整濾波視窗大小（必須為奇數）
+        self.blur_size = self._scaled_odd(7)
+        self.block_size = self._scaled_odd(11)
+        self.morph_kernel = cv2.getStructuringElement(
+            cv2.MORPH_RECT, (self._scaled_odd(5), self._scaled_odd(5))
+        )
+        
+        # GPU 預處理：濾波器只建立一次，每一幀重複使用
+        self.use_cuda = use_cuda and self._cuda_available()
+        if self.use_cuda:
+            self._init_cuda()
+        
+        # OpenCL (T-API)：以 UMat 傳入時 OpenCV 會自動在 OpenCL 裝置上執行
+        self.use_opencl = not self.use_cuda and use_opencl and cv2.ocl.haveOpenCL()
+        if self.use_opencl:
+            cv2.ocl.setUseOpenCL(True)
+            self.use_opencl = cv2.ocl.useOpenCL()
     
-    def preprocess_image(self, image: np.ndarray) -> np.ndarray:
+    @staticmethod
+    def _cuda_available() -> bool:
+        """檢查 OpenCV 是否能使用 CUDA 裝置"""
+        try:
+            return cv2.cuda.getCudaEnabledDeviceCount() > 0
+        except (AttributeError, cv2.error):
+            return False
+    
+    def _init_cuda(self) -> None:
+        """建立 GPU 緩衝區和濾波器"""
+        self._gpu_image = cv2.cuda_GpuMat()
+        self._gpu_blur = cv2.cuda.createGaussianFilter(
+            cv2.CV_8UC1, cv2.CV_8UC1, (self.blur_size, self.blur_size), 0
+        )
+        # adaptiveThreshold 計算加權平均值時使用 BORDER_REPLICATE，保持一致
+        self._gpu_threshold_mean = cv2.cuda.createGaussianFilter(
+            cv2.CV_8UC1, cv2.CV_8UC1, (self.block_size, self.block_size), 0, 0,
+            cv2.BORDER_REPLICATE, cv2.BORDER_REPLICATE
+        )
+        self._gpu_close = cv2.cuda.createMorphologyFilter(
+            cv2.MORPH_CLOSE, cv2.CV_8UC1, self.morph_kernel
+        )
+        logger.info("CVCardDetector 使用 CUDA 進行預處理")
+    
+    def _scaled_odd(self, size: int) -> int:
+        """將視窗大小按檢測比例縮放，並保持為不小於3的奇數"""
+        return max(3, int(size * self.detect_scale) | 1)
+    
+    def preprocess_image(self, image: np.ndarray, gray: Optional[np.ndarray] = None) -> np.ndarray:
         """預處理圖像
         
         Args:
             image: 輸入圖像
+            gray: 已轉換好的灰度圖，如果為None則由 image 轉換
             
         Returns:
             處理後的二值圖像
         """
-        # 轉換為灰度圖
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if self.use_cuda:
+            return self._preprocess_image_cuda(image, gray)
+        
+        # 使用 OpenCL 時整個流程都以 UMat 進行，最後才下載回主記憶體
+        if gray is None:
+            if self.use_opencl:
+                image = cv2.UMat(image)
+            
+            # 轉換為灰度圖
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        elif self.use_opencl:
+            gray = cv2.UMat(gray)
         
         # 高斯模糊，減少噪聲
-        blurred = cv2.GaussianBlur(gray, (7, 7), 0)
+        blurred = cv2.GaussianBlur(gray, (self.blur_size, self.blur_size), 0)
         
         # 自適應二值化
         binary = cv2.adaptiveThreshold(
             blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
+            cv2.THRESH_BINARY, self.block_size, self.THRESHOLD_C
         )
         
         # 形態學操作：閉運算，連接斷開的邊緣
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
-        morph = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        morph = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, self.morph_kernel)
         
+        if self.use_opencl:
+            return morph.get()
         return morph
     
-    def find_rectangles(self, binary: np.ndarray) -> List[np.ndarray]:
+    def _preprocess_image_cuda(self, image: np.ndarray, gray: Optional[np.ndarray] = None) -> np.ndarray:
+        """在 GPU 上預處理圖像，流程與 preprocess_image 相同
+        
+        Args:
+            image: 輸入圖像
+            gray: 已轉換好的灰度圖，有提供時直接上傳，省去彩色圖的傳輸
+            
+        Returns:
+            處理後的二值圖像（已下載回主記憶體，供 findContours 使用）
+        """
+        if gray is None:
+            self._gpu_image.upload(image)
+            gray = cv2.cuda.cvtColor(self._gpu_image, cv2.COLOR_BGR2GRAY)
+        else:
+            self._gpu_image.upload(gray)
+            gray = self._gpu_image
+        blurred = self._gpu_blur.apply(gray)
+        
+        # CUDA 沒有 adaptiveThreshold：與 CPU 相同，先取得 uint8 的高斯加權平均值，
+        # 再以 src - mean > -C 判斷；相減在有號的 16 位元中進行，避免 uint8 飽和
+        # （src + C 在亮部會卡在 255，使 255 > 255 不成立）
+        mean = self._gpu_threshold_mean.apply(blurred).convertTo(cv2.CV_16S)
+        diff = cv2.cuda.subtract(blurred.convertTo(cv2.CV_16S), mean)
+        _, binary = cv2.cuda.threshold(diff, -self.THRESHOLD_C, 255, cv2.THRESH_BINARY)
+        binary = binary.convertTo(cv2.CV_8U)
+        
+        # 形態學操作：閉運算，連接斷開的邊緣
+        morph = self._gpu_close.apply(binary)
+        
+        return morph.download()
+    
+    def find_rectangles(self, binary: np.ndarray, area_scale: float = 1.0) -> List[np.ndarray]:
         """在二值圖像中查找矩形
         
         Args:
             binary: 二值圖像
+            area_scale: 面積縮放比例，用於在縮小的圖像上套用原圖的面積限制
             
         Returns:
             矩形輪廓列表
         """
+        min_area = self.min_area * area_scale
+        max_area = self.max_area * area_scale
+        
         # 查找輪廓
         contours, _ = cv2.findContours(
             binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
         )
-        print(f"[CVCardDetector] 找到 {len(contours)} 個輪廓")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("找到 %d 個輪廓", len(contours))
+        
+        # 先以向量化方式依面積過濾，只對符合的輪廓計算外接矩形
+        areas = np.array([cv2.contourArea(cnt) for cnt in contours], dtype=np.float64)
+        candidates = np.flatnonzero((areas >= min_area) & (areas <= max_area))
+        if debug:
+            logger.debug("面積符合要求的輪廓: %d 個 (%s < area < %s)",
+                         len(candidates), min_area, max_area)
         
         rectangles = []
-        for i, cnt in enumerate(contours):
-            # 計算面積
-            area = cv2.contourArea(cnt)
-            print(f"[CVCardDetector] 輪廓 {i} 面積: {area}")
-            
-            if area < self.min_area or area > self.max_area:
-                print(f"[CVCardDetector] 輪廓 {i} 面積不符合要求 ({self.min_area} < area < {self.max_area})")
+        for i in candidates:
+            # 獲取最小外接矩形，直接使用其寬高計算寬高比
+            rect = cv2.minAreaRect(contours[i])
+            width, height = rect[1]
+            if max(width, height) == 0:
                 continue
-            
-            # 獲取最小外接矩形
-            rect = cv2.minAreaRect(cnt)
-            box = cv2.boxPoints(rect)
-            box = np.int0(box)
-            
-            # 計算寬高比
-            width = np.linalg.norm(box[0] - box[1])
-            height = np.linalg.norm(box[1] - box[2])
             aspect_ratio = min(width, height) / max(width, height)
-            print(f"[CVCardDetector] 輪廓 {i} 寬高比: {aspect_ratio:.3f}")
+            if debug:
+                logger.debug("輪廓 %d 面積: %s，寬高比: %.3f", i, areas[i], aspect_ratio)
             
             # 根據寬高比過濾
             if aspect_ratio < self.min_aspect_ratio or aspect_ratio > self.max_aspect_ratio:
-                print(f"[CVCardDetector] 輪廓 {i} 寬高比不符合要求 ({self.min_aspect_ratio} < ratio < {self.max_aspect_ratio})")
+                if debug:
+                    logger.debug("輪廓 %d 寬高比不符合要求 (%s < ratio < %s)",
+                                 i, self.min_aspect_ratio, self.max_aspect_ratio)
                 continue
             
-            print(f"[CVCardDetector] 輪廓 {i} 符合要求，加入矩形列表")
-            rectangles.append(box)
+            if debug:
+                logger.debug("輪廓 %d 符合要求，加入矩形列表", i)
+            rectangles.append(cv2.boxPoints(rect))
         
         return rectangles
     
@@ -120,34 +234,61 @@ class CVCardDetector:
             列表，每個元素為 ((x1, y1, x2, y2), confidence) 的元組
             注意：由於是傳統方法，confidence 統一設為 1.0
         """
+        # 在縮小的圖像上檢測，減少預處理的像素量
+        scale = self.detect_scale
+        if scale != 1.0:
+            small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = image
+        
+        # 畫面幾乎沒有變化時沿用上次的檢測結果，跳過整個預處理流程
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if (self.motion_threshold > 0 and self._prev_gray is not None
+                and self._prev_gray.shape == gray.shape):
+            motion = cv2.norm(gray, self._prev_gray, cv2.NORM_L1) / gray.size
+            if motion < self.motion_threshold:
+                return list(self._cached_detections)
+        
         # 預處理圖像
-        binary = self.preprocess_image(image)
+        binary = self.preprocess_image(small, gray)
         
         # 查找矩形
-        rectangles = self.find_rectangles(binary)
-        print(f"[CVCardDetector] 找到 {len(rectangles)} 個可能的矩形")
+        rectangles = self.find_rectangles(binary, area_scale=scale * scale)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("找到 %d 個可能的矩形", len(rectangles))
         
-        # 轉換格式
+        # 轉換格式，並將座標還原到原圖大小
         detections = []
         for box in rectangles:
-            bbox = self.convert_to_xyxy(box)
+            bbox = self.convert_to_xyxy(box / scale)
             # 使用固定的置信度 1.0
             detections.append((bbox, 1.0))
-            print(f"[CVCardDetector] 檢測到矩形：{bbox}")
+            if debug:
+                logger.debug("檢測到矩形：%s", bbox)
+        
+        self._prev_gray = gray
+        self._cached_detections = detections
         
         return detections
     
-    def draw_debug(self, image: np.ndarray, detections: List[Tuple[Tuple[int, int, int, int], float]]) -> np.ndarray:
+    def draw_debug(self, image: np.ndarray, detections: List[Tuple[Tuple[int, int, int, int], float]],
+                   out: Optional[np.ndarray] = None) -> np.ndarray:
         """在圖像上繪製除錯信息
         
         Args:
             image: 原始圖像
             detections: 檢測結果列表
+            out: 預先配置的輸出緩衝區，形狀須與 image 相同；如果為None則建立新的副本
             
         Returns:
             帶有標註的圖像
         """
-        debug_image = image.copy()
+        if out is None:
+            debug_image = image.copy()
+        else:
+            np.copyto(out, image)
+            debug_image = out
         
         # 繪製檢測結果
         for i, (bbox, conf) in enumerate(detections):
@@ -158,7 +299,6 @@ class CVCardDetector:
             
             # 添加標籤
             label = f'Card {i+1}'
-            cv2.putText(debug_image, label, (x1, y1-10),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            draw_text(debug_image, label, (x1, y1-10), 0.5, (0, 255, 0), 2)
         
         return debug_image
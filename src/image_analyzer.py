@@ -4,15 +4,21 @@ import cv2
 import os
 import csv
 from collections import Counter
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional
 from .utils import CardMatcher
 from .detector import CardDetector
 
 class ImageAnalyzer(CardMatcher):
     """圖片分析器類"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, use_flann: bool = False):
+        """初始化圖片分析器
+        
+        Args:
+            use_flann: 是否使用 FLANN LSH 索引進行近似搜尋，傳給 CardMatcher
+        """
+        super().__init__(use_flann=use_flann)
         # 初始化卡片檢測器
         self.detector = CardDetector()
     
@@ -51,42 +57,71 @@ class ImageAnalyzer(CardMatcher):
         # 分析每張卡片
         all_matches = []
         for card_image in card_images:
-            matches = self.find_matches(card_image)
+            matches = self.find_matches(card_image, top_k=1)
             if matches:  # 只添加有成功匹配的結果
                 all_matches.append(matches[0])  # 取最佳匹配
                 
         return all_matches
     
-    def export_to_csv(self, matches: List[Tuple[str, float]], output_path: str) -> None:
+    def export_to_csv(self, matches: List[Tuple[str, float]], output_path: str,
+                      card_counts: Optional[Counter] = None) -> None:
         """將卡片識別結果輸出為 CSV 檔案
         
         Args:
             matches: 卡片匹配結果列表
             output_path: CSV 檔案輸出路徑
+            card_counts: 已統計好的卡片數量，如果為None則由 matches 統計
         """
         # 統計每種卡片的數量
-        card_counts = Counter(card_id for card_id, _ in matches)
+        if card_counts is None:
+            card_counts = Counter(card_id for card_id, _ in matches)
         
-        # 寫入 CSV 檔案
+        # 寫入 CSV 檔案，依張數由多到少排列
         with open(output_path, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(['卡片ID', '張數'])
-            for card_id, count in card_counts.items():
-                writer.writerow([card_id, count])
+            writer.writerows(card_counts.most_common())
     
-    def run_analysis(self, card_picture_dir: str = 'data/card_picture') -> None:
+    def _report_results(self, matches: List[Tuple[str, float]], image_path: str) -> None:
+        """輸出 CSV 檔案並列印識別結果
+        
+        Args:
+            matches: 卡片匹配結果列表
+            image_path: 分析的圖片路徑，CSV 輸出至同一目錄
+        """
+        # 統計每種卡片的數量，輸出 CSV 與顯示結果共用
+        card_counts = Counter(card_id for card_id, _ in matches)
+        
+        # 輸出 CSV 檔案
+        output_path = os.path.join(os.path.dirname(image_path), 'card_results.csv')
+        self.export_to_csv(matches, output_path, card_counts)
+        print(f"\n分析結果已輸出至: {output_path}")
+        
+        # 顯示識別結果
+        print("\n識別結果：")
+        for card_id, count in card_counts.items():
+            card_info = self.get_card_info(card_id)
+            if card_info:
+                print(f"卡片: {card_id}")
+                print(f"系列: {card_info['card_set']}")
+                print(f"編號: {card_info['card_name']}")
+                print(f"數量: {count} 張\n")
+    
+    def run_analysis(self, card_picture_dir: str = 'data/card_picture', show_ui: bool = True) -> None:
         """運行圖片分析模式
         
         Args:
             card_picture_dir: 待分析的卡片圖片目錄
+            show_ui: 是否在分析完成後顯示原始圖片視窗，批次處理時可設為False
         """
         if not os.path.exists(card_picture_dir):
             print(f"圖片目錄不存在: {card_picture_dir}")
             return
             
         # 列出所有圖片
-        image_files = [f for f in os.listdir(card_picture_dir)
-                      if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+        with os.scandir(card_picture_dir) as entries:
+            image_files = [entry.name for entry in entries
+                           if entry.is_file() and entry.name.lower().endswith(('.png', '.jpg', '.jpeg'))]
         
         if not image_files:
             print("找不到任何圖片檔案！")
@@ -112,24 +147,17 @@ class ImageAnalyzer(CardMatcher):
                 print("未找到匹配的卡片")
                 return
             
-            # 輸出 CSV 檔案
-            output_path = os.path.join(os.path.dirname(image_path), 'card_results.csv')
-            self.export_to_csv(matches, output_path)
-            print(f"\n分析結果已輸出至: {output_path}")
+            if not show_ui:
+                self._report_results(matches, image_path)
+                return
             
-            # 顯示識別結果
-            print("\n識別結果：")
-            card_counts = Counter(card_id for card_id, _ in matches)
-            for card_id, count in card_counts.items():
-                card_info = self.get_card_info(card_id)
-                if card_info:
-                    print(f"卡片: {card_id}")
-                    print(f"系列: {card_info['card_set']}")
-                    print(f"編號: {card_info['card_name']}")
-                    print(f"數量: {count} 張\n")
+            # 在背景線程讀取原始圖片，與輸出 CSV 和列印結果同時進行
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                display_future = executor.submit(cv2.imread, image_path)
+                self._report_results(matches, image_path)
+                query_img = display_future.result()
             
-            # 讀取原始圖片
-            query_img = cv2.imread(image_path)
+            # 顯示原始圖片；視窗操作必須留在主線程
             cv2.imshow('Original Image', query_img)
             print("\n按任意鍵關閉結果視窗...")
             cv2.waitKey(0)
@@ -7,6 +7,8 @@ import logging
 import shutil
 from dataclasses import dataclass
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 from typing import List, Set
 from urllib.parse import urljoin
@@ -31,27 +33,76 @@ class HOCGScraper:
         'cardlist_view': 'img',
         'cardlist_search_sort': 'new'
     }
+    PROCESSED_URLS_FILE = '.processed_urls.txt'  # 記錄已成功下載的圖片URL，保存在最終目錄
+    CHUNK_SIZE = 64 * 1024                       # 串流寫入檔案的區塊大小
     
-    def __init__(self, temp_dir: str = 'temp/downloads', final_dir: str = 'data/reference_cards'):
+    def __init__(self, temp_dir: str = 'temp/downloads', final_dir: str = 'data/reference_cards',
+                 max_workers: int = 16):
         """初始化爬蟲管理器
         
         Args:
             temp_dir: 臨時下載目錄
             final_dir: 最終圖片保存目錄
+            max_workers: 同時下載的線程數量
         """
         self.temp_dir = temp_dir
         self.final_dir = final_dir
+        self.max_workers = max_workers
         self.logger = logging.getLogger(__name__)
-        self.processed_urls: Set[str] = set()
         
         # 確保目錄存在
         os.makedirs(temp_dir, exist_ok=True)
         os.makedirs(final_dir, exist_ok=True)
         
+        # 讀取上次執行已下載的圖片URL，重新執行時直接略過
+        self.processed_urls_path = os.path.join(final_dir, self.PROCESSED_URLS_FILE)
+        self.processed_urls: Set[str] = self._load_processed_urls()
+        
         # 初始化 session
         self.session = requests.Session()
         self.session.headers.update(self.HEADERS)
         self.session.cookies.update(self.COOKIES)
+        
+        # 連線池大小與下載線程數一致，讓每個線程都能重用連線
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _load_processed_urls(self) -> Set[str]:
+        """讀取已下載的圖片URL記錄
+        
+        Returns:
+            圖片URL集合，沒有記錄時為空集合
+        """
+        try:
+            with open(self.processed_urls_path, 'r', encoding='utf-8') as f:
+                urls = {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+        
+        # 圖片檔案已被刪除或是空檔的URL不算已下載，讓它們重新下載
+        return {url for url in urls if self._card_file_exists(self._extract_card_info(url))}
+    
+    def _save_processed_urls(self) -> None:
+        """保存已下載的圖片URL記錄"""
+        with open(self.processed_urls_path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{url}\n" for url in sorted(self.processed_urls))
+    
+    def _card_file_exists(self, card: CardInfo) -> bool:
+        """檢查卡片圖片是否已存在於最終目錄或臨時目錄，且不是空檔
+        
+        Args:
+            card: 卡片信息
+            
+        Returns:
+            圖片是否已存在
+        """
+        filename = f"{card.card_number}.png"
+        for base_dir in (self.final_dir, self.temp_dir):
+            existing_path = os.path.join(base_dir, card.set_name, filename)
+            if os.path.exists(existing_path) and os.path.getsize(existing_path) > 0:
+                return True
+        return False
     
     def _extract_card_info(self, img_src: str) -> CardInfo:
         """從圖片URL提取卡片信息
@@ -79,20 +130,31 @@ class HOCGScraper:
             下載是否成功
         """
         try:
+            # 已下載過的卡片不再重複下載
+            filename = f"{card.card_number}.png"
+            if self._card_file_exists(card):
+                self.logger.info(f"已存在，略過: {card.set_name}/{filename}")
+                return True
+            
             # 建立卡片集目錄
             set_dir = os.path.join(self.temp_dir, card.set_name)
             os.makedirs(set_dir, exist_ok=True)
             
-            # 下載圖片
+            # 以串流方式下載並直接寫入檔案，不在記憶體中保留整張圖片；
+            # 先寫入暫存檔，完成後才改名，中斷時不會留下被當成已下載的殘缺檔案
             url = urljoin(self.BASE_URL, card.image_url)
-            response = self.session.get(url)
-            response.raise_for_status()
-            
-            # 保存圖片
-            filename = f"{card.card_number}.png"
             filepath = os.path.join(set_dir, filename)
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            partial_path = filepath + '.part'
+            try:
+                with self.session.get(url, stream=True) as response:
+                    response.raise_for_status()
+                    response.raw.decode_content = True
+                    with open(partial_path, 'wb') as f:
+                        shutil.copyfileobj(response.raw, f, length=self.CHUNK_SIZE)
+                os.replace(partial_path, filepath)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
                 
             self.logger.info(f"已下載: {card.set_name}/{filename}")
             return True
@@ -139,25 +201,33 @@ class HOCGScraper:
     def _move_to_final_dir(self) -> None:
         """將檔案從臨時目錄移動到最終目錄"""
         try:
-            # 遍歷所有卡片集目錄
-            for card_set in os.listdir(self.temp_dir):
-                src_dir = os.path.join(self.temp_dir, card_set)
-                dst_dir = os.path.join(self.final_dir, card_set)
-                
-                if os.path.isdir(src_dir):
-                    # 確保目標目錄存在
-                    os.makedirs(dst_dir, exist_ok=True)
-                    
-                    # 移動所有圖片
-                    for filename in os.listdir(src_dir):
-                        src_path = os.path.join(src_dir, filename)
-                        dst_path = os.path.join(dst_dir, filename)
-                        if os.path.isfile(src_path):
-                            shutil.move(src_path, dst_path)
+            # 遍歷所有卡片集目錄；先取出目錄項目再移動，避免在遍歷中修改目錄
+            with os.scandir(self.temp_dir) as entries:
+                set_entries = [entry for entry in entries if entry.is_dir()]
             
-            # 清理臨時目錄
-            shutil.rmtree(self.temp_dir)
-            os.makedirs(self.temp_dir)
+            for set_entry in set_entries:
+                src_dir = set_entry.path
+                dst_dir = os.path.join(self.final_dir, set_entry.name)
+                
+                # 確保目標目錄存在
+                os.makedirs(dst_dir, exist_ok=True)
+                
+                # 移動所有圖片
+                with os.scandir(src_dir) as entries:
+                    file_entries = [entry for entry in entries if entry.is_file()]
+                for file_entry in file_entries:
+                    dst_path = os.path.join(dst_dir, file_entry.name)
+                    try:
+                        # 同一檔案系統內只需更新目錄項目，不必複製檔案內容
+                        os.replace(file_entry.path, dst_path)
+                    except OSError:
+                        shutil.move(file_entry.path, dst_path)
+                
+                # 清理已清空的卡片集目錄
+                try:
+                    os.rmdir(src_dir)
+                except OSError:
+                    self.logger.warning(f"臨時目錄未清空，保留: {src_dir}")
             
         except Exception as e:
             self.logger.error(f"移動檔案時發生錯誤: {str(e)}")
@@ -168,35 +238,39 @@ class HOCGScraper:
         try:
             self.logger.info("開始下載卡片...")
             page = 1
-            total_cards = 0
-            success_count = 0
+            futures = []
             
-            while True:
-                self.logger.info(f"正在處理第 {page} 頁...")
-                cards = self._get_page_cards(page)
-                
-                if not cards:
-                    break
-                
-                for img in cards:
-                    img_src = img.get('src')
-                    if not img_src or img_src in self.processed_urls:
-                        continue
-                        
-                    self.processed_urls.add(img_src)
-                    card_info = self._extract_card_info(img_src)
+            # 下載在線程池中進行，同時繼續抓取下一頁的卡片列表
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while True:
+                    self.logger.info(f"正在處理第 {page} 頁...")
+                    cards = self._get_page_cards(page)
                     
-                    if self._download_card(card_info):
-                        success_count += 1
-                    total_cards += 1
-                
-                page += 1
+                    if not cards:
+                        break
+                    
+                    for img in cards:
+                        img_src = img.get('src')
+                        if not img_src or img_src in self.processed_urls:
+                            continue
+                            
+                        self.processed_urls.add(img_src)
+                        card_info = self._extract_card_info(img_src)
+                        futures.append((img_src, executor.submit(self._download_card, card_info)))
+                    
+                    page += 1
             
+            # 下載失敗的URL不記錄，下次執行時重試
+            failed_urls = {img_src for img_src, future in futures if not future.result()}
+            self.processed_urls -= failed_urls
+            total_cards = len(futures)
+            success_count = total_cards - len(failed_urls)
             self.logger.info(f"下載完成，共 {total_cards} 張卡片，成功 {success_count} 張")
             
             # 移動檔案到最終目錄
             self._move_to_final_dir()
             self.logger.info(f"所有卡片已移動到 {self.final_dir}")
+            self._save_processed_urls()
             
         except Exception as e:
             self.logger.error(f"爬蟲過程中發生錯誤: {str(e)}")
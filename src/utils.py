@@ -4,9 +4,102 @@
 
 import os
 import cv2
+import json
 import logging
+import threading
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional
+from .utils_numba import NUMBA_AVAILABLE, cross_check_matches, score_from_distances
+
+try:
+    import pyvips
+    PYVIPS_AVAILABLE = True
+except ImportError:
+    PYVIPS_AVAILABLE = False
+
+def read_image(image_path: str) -> Optional[np.ndarray]:
+    """讀取 BGR 圖片，已安裝 pyvips 時以其解碼，否則使用 cv2.imread
+    
+    Args:
+        image_path: 圖片路徑
+        
+    Returns:
+        BGR 圖片，讀取失敗時回傳None
+    """
+    if PYVIPS_AVAILABLE:
+        try:
+            # 與 cv2.imread 相同：依 EXIF 方向旋轉
+            image = pyvips.Image.new_from_file(image_path).autorot()
+            
+            # 只處理 8 位元的 sRGB 或灰階圖片；16 位元、CMYK 等格式的轉換方式與
+            # OpenCV 不同，交給 cv2.imread 以免參考特徵改變
+            if image.format != 'uchar' or image.interpretation not in ('srgb', 'b-w'):
+                return cv2.imread(image_path)
+            
+            # 與 cv2.imread 相同：捨棄 alpha 通道，灰階圖擴展為三通道
+            if image.interpretation == 'b-w':
+                image = image.extract_band(0).colourspace('srgb')
+            elif image.bands > 3:
+                image = image.extract_band(0, n=3)
+            array = np.ndarray(buffer=image.write_to_memory(), dtype=np.uint8,
+                               shape=(image.height, image.width, 3))
+            return np.ascontiguousarray(array[:, :, ::-1])
+        except Exception as e:
+            logging.warning(f"pyvips 無法讀取圖片，改用 OpenCV: {image_path}: {str(e)}")
+    return cv2.imread(image_path)
+
+@lru_cache(maxsize=1024)
+def _render_text(text: str, font_scale: float, color: Tuple[int, int, int],
+                 thickness: int) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+    """將文字預先繪製為圖塊，相同的文字只繪製一次
+    
+    Returns:
+        (彩色圖塊, 文字遮罩, 文字基準點在圖塊中的位置) 的元組
+    """
+    (w, h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    
+    # 字形會超出 getTextSize 的範圍，超出量隨字體大小增加；
+    # 圖塊邊緣仍有筆畫時代表邊距不足，加倍後重新繪製，確保與 cv2.putText 完全相同
+    pad = int(np.ceil(font_scale * 4)) + thickness
+    while True:
+        origin = (pad, h + pad)
+        mask = np.zeros((h + baseline + 2 * pad, w + 2 * pad), dtype=np.uint8)
+        cv2.putText(mask, text, origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 255, thickness)
+        if not (mask[0].any() or mask[-1].any() or mask[:, 0].any() or mask[:, -1].any()):
+            break
+        pad *= 2
+    
+    sprite = np.empty(mask.shape + (3,), dtype=np.uint8)
+    sprite[:] = color
+    return sprite, (mask > 0)[..., None], origin
+
+def draw_text(image: np.ndarray, text: str, org: Tuple[int, int],
+              font_scale: float, color: Tuple[int, int, int], thickness: int) -> None:
+    """在圖像上繪製文字，結果與 cv2.putText 相同，但字形只在第一次使用時繪製
+    
+    Args:
+        image: 目標圖像，直接在上面繪製
+        text: 文字內容
+        org: 文字左下角座標
+        font_scale: 字體大小
+        color: 文字顏色
+        thickness: 線條粗細
+    """
+    sprite, mask, (ox, oy) = _render_text(text, font_scale, color, thickness)
+    x0, y0 = org[0] - ox, org[1] - oy
+    h, w = mask.shape[:2]
+    
+    # 裁切超出圖像範圍的部分
+    ix0, iy0 = max(x0, 0), max(y0, 0)
+    ix1, iy1 = min(x0 + w, image.shape[1]), min(y0 + h, image.shape[0])
+    if ix0 >= ix1 or iy0 >= iy1:
+        return
+    
+    sprite_region = (slice(iy0 - y0, iy1 - y0), slice(ix0 - x0, ix1 - x0))
+    np.copyto(image[iy0:iy1, ix0:ix1], sprite[sprite_region], where=mask[sprite_region])
 
 class ImageProcessor:
     """基礎圖像處理類"""
@@ -29,6 +122,8 @@ class ImageProcessor:
             調整後的圖片
         """
         h, w = image.shape[:2]
+        if h == self.display_height:
+            return image
         scale = self.display_height / h
         return cv2.resize(image, (int(w * scale), self.display_height))
     
@@ -47,41 +142,54 @@ class ImageProcessor:
         # 調整查詢圖片大小
         query_display = self.resize_image(query_img)
         
-        # 準備參考卡片顯示
+        # 準備參考卡片顯示（圖片可能是共用的快取，文字在拼接後才繪製）
         ref_displays = []
+        labels = []
+        x_offset = query_display.shape[1]
         for ref_img, card_id, score in ref_images[:3]:  # 只顯示前三個結果
             # 調整參考卡片大小
             ref_display = self.resize_image(ref_img)
-            
-            # 添加文字標註
-            cv2.putText(ref_display,
-                       f"{card_id}",
-                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                       (0, 255, 0), 2)
-            cv2.putText(ref_display,
-                       f"Score: {score:.2f}%",
-                       (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1,
-                       (0, 255, 0), 2)
-            
             ref_displays.append(ref_display)
+            labels.append((x_offset, card_id, score))
+            x_offset += ref_display.shape[1]
         
         # 水平拼接所有圖片
         all_displays = [query_display] + ref_displays
-        return cv2.hconcat(all_displays)
+        display = cv2.hconcat(all_displays)
+        
+        # 添加文字標註
+        for x_offset, card_id, score in labels:
+            draw_text(display, f"{card_id}", (x_offset + 10, 30), 1, (0, 255, 0), 2)
+            draw_text(display, f"Score: {score:.2f}%", (x_offset + 10, 70), 1, (0, 255, 0), 2)
+        
+        return display
 
 class CardMatcher(ImageProcessor):
     """卡片匹配器類，用於識別和匹配卡片圖像"""
     
+    FEATURE_CACHE_NAME = '.cache.npz'  # 特徵快取檔名，索引與所有特徵保存在同一個檔案
+    FEATURE_CACHE_VERSION = 3          # 特徵提取方式或快取格式改變時遞增，讓舊快取失效
+    
+    # ORB 參數：score_threshold 與 min_match_count 是以 OpenCV 預設值（500 個特徵點、
+    # 原始解析度）調整的，減少特徵點或縮小圖片會讓相機裁切出的小卡片無法達到閾值
+    ORB_PARAMS: Dict = {}
+    FLANN_KNN = 8           # FLANN 每個查詢描述符取回的近鄰數量，需大於同一張卡片的平行版本數
+    MATCH_BATCH_SIZE = 1 << 22  # 暴力搜尋時每批距離矩陣的元素數量上限（int32 約 16MB）
+    MATCH_CACHE_SIZE = 8    # 依查詢圖片雜湊保留的最近匹配結果數量
+    HASH_SIZE = 16          # 查詢圖片雜湊的縮圖邊長，共 HASH_SIZE * HASH_SIZE 位元
+    
     def __init__(self, 
                  reference_dir: str = 'data/reference_cards',
                  min_match_count: int = 20,
-                 score_threshold: int = 45):
+                 score_threshold: int = 45,
+                 use_flann: bool = False):
         """初始化卡片匹配器
         
         Args:
             reference_dir: 參考卡片目錄路徑
             min_match_count: 最小匹配點數量
             score_threshold: 最小匹配分數閾值
+            use_flann: 是否使用 FLANN LSH 索引進行近似搜尋，預設以暴力搜尋逐張卡片交叉驗證
         """
         super().__init__()
         self.reference_dir = reference_dir
@@ -89,127 +197,544 @@ class CardMatcher(ImageProcessor):
         self.score_threshold = score_threshold
         self.reference_cards: Dict[str, Dict] = {}
         
-        # 初始化特徵檢測器和匹配器
-        self.feature_detector = cv2.ORB_create()
-        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        # 所有參考卡片描述符合併後的矩陣，以及每一列對應的卡片索引
+        self._card_ids: List[str] = []
+        self._descriptor_bank: Optional[np.ndarray] = None
+        self._row_to_card = np.empty(0, dtype=np.int32)
+        self._card_offsets = np.zeros(1, dtype=np.int64)
+        
+        # 描述符矩陣的 uint64 視圖，供 Numba 暴力搜尋核心使用
+        self._descriptor_words: Optional[np.ndarray] = None
+        
+        # 以查詢圖片雜湊為鍵的最近匹配結果，相機模式下連續畫面中的同一張卡片不必重新比對
+        self._match_cache: OrderedDict = OrderedDict()
+        
+        # 查詢圖片轉灰階時重複使用的緩衝區，只在查詢路徑使用
+        self._gray_buf = np.empty(0, dtype=np.uint8)
+        
+        # 初始化特徵檢測器和匹配器；暴力搜尋直接計算距離矩陣，不需要匹配器
+        self.feature_detector = self._create_feature_detector()
+        self.matcher: Optional[cv2.DescriptorMatcher] = None
+        if use_flann:
+            # LSH 索引適用於 ORB 的二進位描述符，algorithm=6 即 FLANN_INDEX_LSH
+            index_params = dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1)
+            self.matcher = cv2.FlannBasedMatcher(index_params, dict(checks=50))
         
         # 載入參考卡片
         self._load_reference_cards()
     
-    def _extract_features(self, image: np.ndarray) -> Tuple[Optional[List], Optional[np.ndarray]]:
+    @classmethod
+    def _create_feature_detector(cls) -> cv2.Feature2D:
+        """建立特徵檢測器"""
+        return cv2.ORB_create(**cls.ORB_PARAMS)
+    
+    def _extract_features(self, image: np.ndarray,
+                          feature_detector: Optional[cv2.Feature2D] = None
+                          ) -> Tuple[Optional[List], Optional[np.ndarray]]:
         """提取圖像特徵
         
         Args:
             image: 輸入圖像
+            feature_detector: 使用的特徵檢測器，如果為None則使用 self.feature_detector
+                並將灰階圖寫入共用的緩衝區；多線程呼叫時必須各自提供
             
         Returns:
             特徵點和描述符的元組
         """
+        use_shared_buffer = feature_detector is None
+        if feature_detector is None:
+            feature_detector = self.feature_detector
         try:
-            return self.feature_detector.detectAndCompute(image, None)
+            if use_shared_buffer and image.ndim == 3:
+                image = self._to_gray(image)
+            return feature_detector.detectAndCompute(image, None)
         except Exception as e:
             logging.error(f"特徵提取失敗: {str(e)}")
             return None, None
     
-    def _calculate_match_score(self, matches: List, min_count: int) -> float:
-        """計算匹配分數
+    def _to_gray(self, image: np.ndarray) -> np.ndarray:
+        """將 BGR 圖像轉為灰階，結果寫入重複使用的緩衝區
+        
+        每張查詢卡片的尺寸都略有不同，因此緩衝區以一維陣列保存，只在容量不足時擴大，
+        回傳的灰階圖是緩衝區前段的視圖，下一次呼叫時會被覆寫
         
         Args:
-            matches: 匹配結果列表
+            image: BGR 圖像
+            
+        Returns:
+            灰階圖像
+        """
+        height, width = image.shape[:2]
+        if self._gray_buf.size < height * width:
+            self._gray_buf = np.empty(height * width, dtype=np.uint8)
+        gray = self._gray_buf[:height * width].reshape(height, width)
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=gray)
+        return gray
+    
+    def _calculate_match_scores(self, card_indices: np.ndarray, distances: np.ndarray,
+                                min_count: int) -> np.ndarray:
+        """一次計算所有參考卡片的匹配分數
+        
+        Args:
+            card_indices: 每個匹配點所屬的卡片索引
+            distances: 每個匹配點的距離
             min_count: 最小匹配點數量
             
         Returns:
-            匹配分數 (0-100)
+            每張參考卡片的匹配分數 (0-100)，索引與 self._card_ids 對應
+        """
+        n_cards = len(self._card_ids)
+        if NUMBA_AVAILABLE:
+            return score_from_distances(card_indices, distances, n_cards, min_count)
+        
+        scores = np.zeros(n_cards, dtype=np.float64)
+        
+        # 匹配點數量不足的卡片不可能得分，先排除，只對其餘的匹配點排序
+        counts = np.bincount(card_indices, minlength=n_cards)
+        counts[counts < min_count] = 0
+        eligible = counts[card_indices] > 0
+        if not eligible.any():
+            return scores
+        card_indices = card_indices[eligible]
+        distances = distances[eligible]
+        
+        # 依卡片分組，組內按距離升序排列
+        order = np.lexsort((distances, card_indices))
+        cards_sorted = card_indices[order]
+        distances_sorted = distances[order]
+        
+        # 每個匹配點在其卡片內的名次
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(len(cards_sorted)) - starts[cards_sorted]
+        
+        # 計算每張卡片前N個最佳匹配的平均距離
+        best = rank < min_count
+        distance_sums = np.bincount(cards_sorted[best], weights=distances_sorted[best],
+                                    minlength=n_cards)
+        valid = counts > 0
+        scores[valid] = np.maximum(0.0, 100.0 - distance_sums[valid] / min_count)
+        return scores
+    
+    @staticmethod
+    def _keypoints_to_array(keypoints: List) -> np.ndarray:
+        """將特徵點轉換為 (x, y, size, angle, response, octave) 陣列"""
+        return np.array([(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave)
+                         for kp in keypoints], dtype=np.float32).reshape(-1, 6)
+    
+    @staticmethod
+    def _array_to_keypoints(array: np.ndarray) -> Tuple:
+        """由陣列重建特徵點"""
+        return tuple(cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave))
+                     for x, y, size, angle, response, octave in array)
+    
+    def _feature_cache_signature(self) -> str:
+        """特徵快取的簽名，提取參數改變時舊快取即失效"""
+        return json.dumps({'version': self.FEATURE_CACHE_VERSION,
+                           'orb': self.ORB_PARAMS}, sort_keys=True)
+    
+    def _load_feature_cache(self) -> Dict[str, Tuple[float, np.ndarray, np.ndarray]]:
+        """讀取特徵快取
+        
+        Returns:
+            字典，卡片ID 對應 (檔案修改時間, 特徵點陣列, 描述符) 的元組
         """
-        if len(matches) < min_count:
-            return 0.0
+        cache_path = os.path.join(self.reference_dir, self.FEATURE_CACHE_NAME)
+        try:
+            with np.load(cache_path, allow_pickle=False) as cache:
+                if str(cache['signature']) != self._feature_cache_signature():
+                    return {}
+                card_ids = cache['card_ids']
+                mtimes = cache['mtimes']
+                counts = cache['counts']
+                keypoints = cache['keypoints']
+                descriptors = cache['descriptors']
             
-        # 計算前N個最佳匹配的平均距離
-        avg_distance = sum(m.distance for m in matches[:min_count]) / min_count
-        return max(0, 100 - avg_distance)
+            # 各陣列長度不一致代表快取已損壞，整份捨棄
+            offsets = np.concatenate(([0], np.cumsum(counts)))
+            if not (len(card_ids) == len(mtimes) == len(counts)
+                    and len(keypoints) == len(descriptors) == offsets[-1]):
+                raise ValueError("快取內容不一致")
+            
+            return {str(card_id): (float(mtime), keypoints[start:end], descriptors[start:end])
+                    for card_id, mtime, start, end
+                    in zip(card_ids, mtimes, offsets[:-1], offsets[1:])}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"無法讀取特徵快取，將重新計算: {str(e)}")
+            return {}
     
-    def _load_single_card(self, card_path: str, card_set: str, card_name: str) -> None:
-        """載入單張參考卡片"""
+    def _save_feature_cache(self, entries: Dict[str, Tuple[float, np.ndarray, np.ndarray]]) -> None:
+        """寫入特徵快取
+        
+        卡片ID、修改時間與特徵保存在同一個 .npz 中，只需一次 os.replace 即可更新，
+        中斷時只會留下完整的舊快取或完整的新快取
+        
+        Args:
+            entries: 字典，卡片ID 對應 (檔案修改時間, 特徵點陣列, 描述符) 的元組
+        """
+        cache_path = os.path.join(self.reference_dir, self.FEATURE_CACHE_NAME)
+        temp_path = cache_path[:-len('.npz')] + '.tmp.npz'
+        card_ids = list(entries.keys())
+        values = [entries[card_id] for card_id in card_ids]
+        
+        try:
+            np.savez_compressed(
+                temp_path,
+                signature=np.array(self._feature_cache_signature()),
+                card_ids=np.array(card_ids, dtype=str),
+                mtimes=np.array([mtime for mtime, _, _ in values], dtype=np.float64),
+                counts=np.array([len(descriptors) for _, _, descriptors in values], dtype=np.int64),
+                keypoints=np.concatenate([keypoints for _, keypoints, _ in values]) if values
+                          else np.empty((0, 6), dtype=np.float32),
+                descriptors=np.concatenate([descriptors for _, _, descriptors in values]) if values
+                            else np.empty((0, 32), dtype=np.uint8))
+            os.replace(temp_path, cache_path)
+        except Exception as e:
+            logging.warning(f"無法寫入特徵快取: {str(e)}")
+    
+    def _load_single_card(self, card_path: str, card_set: str, card_name: str,
+                          feature_detector: Optional[cv2.Feature2D] = None,
+                          cached_features: Optional[Tuple[np.ndarray, np.ndarray]] = None
+                          ) -> Optional[Tuple[str, Dict]]:
+        """載入單張參考卡片
+        
+        Args:
+            card_path: 卡片圖片路徑
+            card_set: 卡片系列
+            card_name: 卡片編號
+            feature_detector: 使用的特徵檢測器，多線程載入時每個線程各自一個
+            cached_features: 快取的 (特徵點陣列, 描述符)，有提供時不重新計算特徵
+            
+        Returns:
+            (卡片ID, 卡片資訊) 的元組，載入失敗時回傳None
+        """
         try:
-            img = cv2.imread(card_path)
+            img = read_image(card_path)
             if img is None:
                 logging.error(f"無法讀取卡片圖片: {card_path}")
-                return
+                return None
                 
             # 提取特徵
-            keypoints, descriptors = self._extract_features(img)
+            if cached_features is not None:
+                keypoints = self._array_to_keypoints(cached_features[0])
+                descriptors = cached_features[1]
+            else:
+                keypoints, descriptors = self._extract_features(img, feature_detector)
             if descriptors is None:
                 logging.error(f"無法計算卡片特徵: {card_path}")
-                return
+                return None
                 
-            # 儲存卡片資訊
+            # 整理卡片資訊
             card_id = f"{card_set}/{card_name}"
-            self.reference_cards[card_id] = {
+            return card_id, {
                 'img': img,
                 'keypoints': keypoints,
                 'descriptors': descriptors,
                 'card_set': card_set,
                 'card_name': card_name
             }
-            logging.info(f"已載入卡片: {card_id}")
             
         except Exception as e:
             logging.error(f"處理卡片時發生錯誤 {card_path}: {str(e)}")
+            return None
 
     def _load_reference_cards(self) -> None:
         """載入所有參考卡片"""
         if not os.path.exists(self.reference_dir):
             logging.error(f"參考卡片目錄不存在: {self.reference_dir}")
             return
-            
-        for card_set in os.listdir(self.reference_dir):
-            set_dir = os.path.join(self.reference_dir, card_set)
-            if not os.path.isdir(set_dir):
-                continue
-                
-            for card_file in os.listdir(set_dir):
-                if not card_file.lower().endswith(('.png', '.jpg', '.jpeg')):
+        
+        # 讀取特徵快取，檔案修改時間相同的卡片不必重新計算特徵
+        cache = self._load_feature_cache()
+        
+        # 收集所有要載入的卡片
+        # 以 scandir 遍歷，目錄項目已帶有名稱、路徑與類型，不需要額外的系統呼叫
+        tasks = []
+        with os.scandir(self.reference_dir) as set_entries:
+            for set_entry in set_entries:
+                if not set_entry.is_dir():
                     continue
                     
-                card_path = os.path.join(set_dir, card_file)
-                card_name = os.path.splitext(card_file)[0]
-                self._load_single_card(card_path, card_set, card_name)
+                with os.scandir(set_entry.path) as card_entries:
+                    for card_entry in card_entries:
+                        if not card_entry.name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                            continue
+                            
+                        card_set = set_entry.name
+                        card_name = os.path.splitext(card_entry.name)[0]
+                        mtime = card_entry.stat().st_mtime
+                        cached = cache.get(f"{card_set}/{card_name}")
+                        cached_features = cached[1:] if cached and cached[0] == mtime else None
+                        tasks.append((card_entry.path, card_set, card_name, mtime, cached_features))
+        
+        # 以多線程載入：cv2 在讀檔和計算特徵時會釋放 GIL；
+        # 特徵檢測器不保證線程安全，每個線程各自建立一個
+        local = threading.local()
+        
+        def load(task: Tuple) -> Optional[Tuple[str, Dict]]:
+            card_path, card_set, card_name, _, cached_features = task
+            if not hasattr(local, 'feature_detector'):
+                local.feature_detector = self._create_feature_detector()
+            return self._load_single_card(card_path, card_set, card_name,
+                                          feature_detector=local.feature_detector,
+                                          cached_features=cached_features)
         
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = list(executor.map(load, tasks))
+        
+        # 在主線程中依序合併結果，不需要鎖
+        new_cache = {}
+        cache_changed = False
+        for task, result in zip(tasks, results):
+            if result is None:
+                continue
+            card_id, card_info = result
+            self.reference_cards[card_id] = card_info
+            logging.info(f"已載入卡片: {card_id}")
+            
+            mtime, cached_features = task[3], task[4]
+            if cached_features is not None:
+                new_cache[card_id] = (mtime,) + cached_features
+            else:
+                keypoints = self._keypoints_to_array(card_info['keypoints'])
+                new_cache[card_id] = (mtime, keypoints, card_info['descriptors'])
+                cache_changed = True
+        
+        # 有新計算的卡片或有卡片被移除時更新快取
+        if cache_changed or new_cache.keys() != cache.keys():
+            self._save_feature_cache(new_cache)
+        
+        self._build_descriptor_bank()
         logging.info(f"共載入 {len(self.reference_cards)} 張參考卡片")
     
-    def find_matches(self, query_img: np.ndarray, min_match_count: Optional[int] = None) -> List[Tuple[str, float]]:
+    def _build_descriptor_bank(self) -> None:
+        """將所有參考卡片的描述符合併為單一矩陣，讓比對只需呼叫一次匹配器"""
+        self._card_ids = list(self.reference_cards.keys())
+        self._match_cache.clear()
+        if self.matcher is not None:
+            self.matcher.clear()
+        if not self._card_ids:
+            self._descriptor_bank = None
+            self._descriptor_words = None
+            self._card_offsets = np.zeros(1, dtype=np.int64)
+            self._row_to_card = np.empty(0, dtype=np.int32)
+            return
+        
+        cards = [self.reference_cards[card_id] for card_id in self._card_ids]
+        counts = [len(card['descriptors']) for card in cards]
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        
+        # 預先配置連續的矩陣並逐列寫入，每張卡片的描述符改為指向矩陣的視圖，
+        # 不再各自持有一份獨立配置的陣列
+        bank = np.empty((offsets[-1], cards[0]['descriptors'].shape[1]), dtype=np.uint8)
+        for card, start, end in zip(cards, offsets[:-1], offsets[1:]):
+            bank[start:end] = card['descriptors']
+            card['descriptors'] = bank[start:end]
+        
+        self._descriptor_bank = bank
+        self._row_to_card = np.repeat(np.arange(len(cards), dtype=np.int32), counts)
+        self._card_offsets = offsets.astype(np.int64)
+        
+        # 每列長度為 8 的倍數時（ORB 為 32 位元組）才能以 uint64 視圖比較
+        self._descriptor_words = None
+        if NUMBA_AVAILABLE and self.matcher is None and bank.shape[1] % 8 == 0:
+            self._descriptor_words = bank.view(np.uint64)
+        
+        # 將描述符矩陣加入匹配器並建立索引，查詢時不必每次再傳入
+        if self.matcher is not None:
+            self.matcher.add([bank])
+            self.matcher.train()
+    
+    def _match_descriptors(self, query_descriptors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """將查詢描述符與所有參考卡片比對
+        
+        暴力搜尋與原本逐張卡片呼叫 BFMatcher(crossCheck=True) 的結果相同：每個查詢描述符
+        對每張卡片最多一個匹配點，平行版本等外觀幾乎相同的卡片不會互相分票。
+        
+        Args:
+            query_descriptors: 查詢圖片的描述符
+            
+        Returns:
+            (每個匹配點所屬的卡片索引, Hamming 距離) 的元組
+        """
+        if self.matcher is not None:
+            return self._match_descriptors_flann(query_descriptors)
+        
+        if self._descriptor_words is not None:
+            query_words = np.ascontiguousarray(query_descriptors).view(np.uint64)
+            return cross_check_matches(query_words, self._descriptor_words, self._card_offsets)
+        
+        return self._match_descriptors_batch(query_descriptors)
+    
+    def _match_descriptors_batch(self, query_descriptors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """以 cv2.batchDistance 分批計算距離矩陣，逐張卡片進行交叉驗證，參數同 _match_descriptors"""
+        offsets = self._card_offsets
+        n_query = len(query_descriptors)
+        max_rows = max(1, self.MATCH_BATCH_SIZE // n_query)
+        card_indices, distances = [], []
+        
+        first = 0
+        n_cards = len(offsets) - 1
+        while first < n_cards:
+            # 每批包含完整的卡片，總列數不超過上限（至少一張卡片）
+            last = max(first + 1, int(np.searchsorted(offsets, offsets[first] + max_rows, side='right')) - 1)
+            start, end = offsets[first], offsets[last]
+            dist = cv2.batchDistance(query_descriptors, self._descriptor_bank[start:end],
+                                     cv2.CV_32S, normType=cv2.NORM_HAMMING)[0]
+            n_cols = end - start
+            columns = np.arange(n_cols)
+            
+            # 每個查詢描述符在每張卡片內的最近鄰；距離相同時取索引最小者，與 BFMatcher 一致
+            keys = dist.astype(np.int64) * n_cols + columns
+            row_best = np.minimum.reduceat(keys, offsets[first:last] - start, axis=1) % n_cols
+            
+            # 反向檢查：卡片描述符的最近查詢描述符也必須選中它
+            col_best = dist.argmin(axis=0)
+            local_cards = self._row_to_card[start:end] - first
+            mutual = row_best[col_best, local_cards] == columns
+            
+            card_indices.append(self._row_to_card[start:end][mutual])
+            distances.append(dist[col_best[mutual], columns[mutual]].astype(np.float32))
+            first = last
+        
+        return np.concatenate(card_indices), np.concatenate(distances)
+    
+    def _match_descriptors_flann(self, query_descriptors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """以 FLANN LSH 索引近似比對，參數同 _match_descriptors
+        
+        LSH 無法做逐張卡片的交叉驗證，改為每個查詢描述符取回多個近鄰，
+        每張卡片只保留距離最近的一個，讓平行版本的卡片各自都能得到匹配點。
+        """
+        knn_matches = self.matcher.knnMatch(query_descriptors, k=self.FLANN_KNN)
+        count = sum(len(neighbors) for neighbors in knn_matches)
+        
+        # 已知長度時以 fromiter 直接填入預先配置的陣列，不建立中間列表
+        query_indices = np.fromiter((m.queryIdx for neighbors in knn_matches for m in neighbors),
+                                    dtype=np.int64, count=count)
+        train_indices = np.fromiter((m.trainIdx for neighbors in knn_matches for m in neighbors),
+                                    dtype=np.int64, count=count)
+        distances = np.fromiter((m.distance for neighbors in knn_matches for m in neighbors),
+                                dtype=np.float32, count=count)
+        
+        # LSH 找不到鄰居時索引為負數，直接忽略
+        found = train_indices >= 0
+        query_indices, train_indices, distances = query_indices[found], train_indices[found], distances[found]
+        card_indices = self._row_to_card[train_indices]
+        
+        # 近鄰已按距離排序，每組 (查詢描述符, 卡片) 取第一個即最近者
+        _, first = np.unique(query_indices * len(self._card_ids) + card_indices, return_index=True)
+        return card_indices[first], distances[first]
+    
+    def _image_hash(self, image: np.ndarray) -> bytes:
+        """計算圖片的平均雜湊：縮圖後以平均亮度為閾值，每個像素一個位元
+        
+        Args:
+            image: BGR 圖像
+            
+        Returns:
+            雜湊值的位元組
+        """
+        thumbnail = cv2.resize(image, (self.HASH_SIZE, self.HASH_SIZE), interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return np.packbits(thumbnail > thumbnail.mean()).tobytes()
+    
+    def find_matches(self, query_img: np.ndarray, min_match_count: Optional[int] = None,
+                     top_k: Optional[int] = None) -> List[Tuple[str, float]]:
         """尋找匹配的卡片
         
+        外觀相同（雜湊相同）的查詢圖片直接回傳最近一次的匹配結果
+        
         Args:
             query_img: 查詢圖片
             min_match_count: 最小匹配點數量，如果為None則使用初始化時設定的值
+            top_k: 只回傳分數最高的前K個結果，如果為None則回傳全部
             
         Returns:
             列表，包含 (卡片ID, 匹配分數) 的元組，按分數降序排序
         """
         min_match_count = min_match_count or self.min_match_count
+        if query_img is None or query_img.size == 0:
+            return []
+        
+        try:
+            key = (self._image_hash(query_img), min_match_count, top_k)
+        except Exception as e:
+            # 無法計算雜湊時不使用快取，直接比對
+            logging.error(f"計算查詢圖片雜湊失敗: {str(e)}")
+            return self._compute_matches(query_img, min_match_count, top_k)
+        
+        cached = self._match_cache.get(key)
+        if cached is not None:
+            self._match_cache.move_to_end(key)
+            return list(cached)
         
+        matches = self._compute_matches(query_img, min_match_count, top_k)
+        self._match_cache[key] = matches
+        if len(self._match_cache) > self.MATCH_CACHE_SIZE:
+            self._match_cache.popitem(last=False)
+        return list(matches)
+    
+    def _compute_matches(self, query_img: np.ndarray, min_match_count: int,
+                         top_k: Optional[int]) -> List[Tuple[str, float]]:
+        """提取查詢圖片特徵並與所有參考卡片比對，參數同 find_matches"""
         # 提取查詢圖片特徵
         query_keypoints, query_descriptors = self._extract_features(query_img)
-        if query_descriptors is None:
+        if query_descriptors is None or self._descriptor_bank is None:
+            return []
+        
+        # 每個查詢描述符最多只會對應一個匹配點，數量不足時沒有卡片能達到最小匹配點數量
+        if len(query_descriptors) < min_match_count:
+            return []
+        
+        # 一次與所有參考卡片的描述符比對
+        card_indices, distances = self._match_descriptors(query_descriptors)
+        if not len(card_indices):
             return []
         
-        matches_list = []
+        # 計算匹配分數
+        scores = self._calculate_match_scores(card_indices, distances, min_match_count)
+        candidates = np.flatnonzero(scores > self.score_threshold)
         
-        # 與所有參考卡片比對
-        for card_id, card_info in self.reference_cards.items():
-            # 特徵匹配
-            matches = self.matcher.match(query_descriptors, card_info['descriptors'])
-            matches = sorted(matches, key=lambda x: x.distance)
-            
-            # 計算匹配分數
-            score = self._calculate_match_score(matches, min_match_count)
-            if score > self.score_threshold:
-                matches_list.append((card_id, score))
+        # 只保留前K個結果，避免對全部候選排序
+        if top_k is not None and top_k < len(candidates):
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
         
         # 按分數降序排序
-        return sorted(matches_list, key=lambda x: x[1], reverse=True)
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self._card_ids[i], float(scores[i])) for i in candidates]
     
     def get_card_info(self, card_id: str) -> Optional[Dict]:
         """獲取卡片資訊"""
         return self.reference_cards.get(card_id)
+    
+    def get_card_thumbnail(self, card_id: str, width: Optional[int] = None,
+                           height: Optional[int] = None) -> Optional[np.ndarray]:
+        """獲取縮放後的參考卡片圖片，每種尺寸只縮放一次並快取在卡片資訊中
+        
+        Args:
+            card_id: 卡片ID
+            width: 目標寬度，如果為None則依高度等比例縮放
+            height: 目標高度，如果為None則依寬度等比例縮放，兩者皆為None時使用顯示高度
+            
+        Returns:
+            縮放後的圖片（共用快取，請勿直接在上面繪製），找不到卡片時回傳None
+        """
+        card_info = self.reference_cards.get(card_id)
+        if not card_info or 'img' not in card_info:
+            return None
+        
+        if width is None and height is None:
+            height = self.display_height
+        
+        thumbnails = card_info.setdefault('thumbnails', {})
+        thumbnail = thumbnails.get((width, height))
+        if thumbnail is None:
+            img = card_info['img']
+            h, w = img.shape[:2]
+            target_w = width if width is not None else int(w * height / h)
+            target_h = height if height is not None else int(h * width / w)
+            thumbnail = cv2.resize(img, (target_w, target_h))
+            thumbnails[(width, height)] = thumbnail
+        return thumbnail
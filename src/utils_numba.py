@@ -0,0 +1,144 @@
+"""
+Numba 加速的比對核心（選用，未安裝 Numba 時由 NumPy 實作代替）
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    
+    def njit(*args, **kwargs):
+        """未安裝 Numba 時的替代裝飾器，不做任何編譯"""
+        def decorator(func):
+            return func
+        return decorator
+
+@njit(cache=True, fastmath=True)
+def score_from_distances(card_indices: np.ndarray, distances: np.ndarray,
+                         n_cards: int, min_count: int) -> np.ndarray:
+    """計算每張卡片前N個最佳匹配的平均距離換算成的分數
+    
+    漢明距離只會是 0-256 的整數，以計數排序取代一般排序。直方圖只為匹配點數量
+    達到 min_count 的卡片配置，整體為 O(n + n_cards + 257 * 符合條件的卡片數)。
+    
+    Args:
+        card_indices: 每個匹配點所屬的卡片索引
+        distances: 每個匹配點的漢明距離
+        n_cards: 參考卡片數量
+        min_count: 最小匹配點數量
+        
+    Returns:
+        每張參考卡片的匹配分數 (0-100)
+    """
+    scores = np.zeros(n_cards, dtype=np.float64)
+    counts = np.zeros(n_cards, dtype=np.int32)
+    for i in range(card_indices.shape[0]):
+        counts[card_indices[i]] += 1
+    
+    # 只為匹配點數量足夠的卡片分配直方圖的列
+    slots = np.full(n_cards, -1, dtype=np.int32)
+    n_eligible = 0
+    for card in range(n_cards):
+        if counts[card] >= min_count:
+            slots[card] = n_eligible
+            n_eligible += 1
+    if n_eligible == 0:
+        return scores
+    
+    eligible_cards = np.empty(n_eligible, dtype=np.int32)
+    for card in range(n_cards):
+        if slots[card] >= 0:
+            eligible_cards[slots[card]] = card
+    
+    histogram = np.zeros((n_eligible, 257), dtype=np.int32)
+    for i in range(card_indices.shape[0]):
+        slot = slots[card_indices[i]]
+        if slot >= 0:
+            histogram[slot, int(distances[i])] += 1
+    
+    for slot in range(n_eligible):
+        # 從最小的距離開始累加，直到取滿 min_count 個匹配點
+        remaining = min_count
+        total = 0.0
+        for distance in range(257):
+            taken = min(histogram[slot, distance], remaining)
+            total += taken * distance
+            remaining -= taken
+            if remaining == 0:
+                break
+        scores[eligible_cards[slot]] = max(0.0, 100.0 - total / min_count)
+    return scores
+
+@njit(cache=True, inline='always')
+def _popcount64(x: np.uint64) -> np.int64:
+    """計算 64 位元整數中為 1 的位元數"""
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return np.int64((x * np.uint64(0x0101010101010101)) >> np.uint64(56))
+
+@njit(cache=True)
+def cross_check_matches(query_words: np.ndarray, bank_words: np.ndarray, offsets: np.ndarray):
+    """逐張參考卡片進行交叉驗證的暴力匹配，結果與 BFMatcher(NORM_HAMMING, crossCheck=True) 相同
+    
+    查詢描述符 i 與卡片中的描述符 j 互為對方在該卡片內的最近鄰時才算一個匹配點，
+    因此每個查詢描述符對每張卡片都可以各投一票，平行版本的卡片不會互相分票。
+    描述符以 uint64 視圖傳入（ORB 的 32 位元組即 4 個 uint64），每次以 XOR 加上位元計數
+    比較 64 位元。不使用 parallel=True：此核心會在相機模式的比對線程中呼叫，
+    Numba 的平行執行緒層在非主線程中啟動時會讓直譯器在結束時卡住。
+    
+    Args:
+        query_words: 查詢描述符的 uint64 視圖，形狀為 (Nq, W)
+        bank_words: 參考描述符矩陣的 uint64 視圖，形狀為 (Nr, W)
+        offsets: 每張卡片在描述符矩陣中的起始列，最後一項為總列數
+        
+    Returns:
+        (每個匹配點所屬的卡片索引, 漢明距離) 的元組
+    """
+    n_query, n_words = query_words.shape
+    n_cards = offsets.shape[0] - 1
+    max_rows = 0
+    for card in range(n_cards):
+        max_rows = max(max_rows, offsets[card + 1] - offsets[card])
+    
+    block = np.empty((n_query, max_rows), dtype=np.int64)
+    row_best = np.empty(n_query, dtype=np.int64)
+    out_cards = np.empty(bank_words.shape[0], dtype=np.int32)
+    out_distances = np.empty(bank_words.shape[0], dtype=np.float32)
+    n_out = 0
+    
+    for card in range(n_cards):
+        start = offsets[card]
+        n_rows = offsets[card + 1] - start
+        
+        # 計算查詢描述符與此卡片所有描述符的距離，同時記下每個查詢描述符的最近鄰
+        for i in range(n_query):
+            best = n_words * 64 + 1
+            best_row = 0
+            for j in range(n_rows):
+                distance = 0
+                for k in range(n_words):
+                    distance += _popcount64(query_words[i, k] ^ bank_words[start + j, k])
+                block[i, j] = distance
+                if distance < best:
+                    best = distance
+                    best_row = j
+            row_best[i] = best_row
+        
+        # 反向檢查：卡片描述符的最近查詢描述符也必須選中它
+        for j in range(n_rows):
+            best = n_words * 64 + 1
+            best_query = 0
+            for i in range(n_query):
+                if block[i, j] < best:
+                    best = block[i, j]
+                    best_query = i
+            if row_best[best_query] == j:
+                out_cards[n_out] = card
+                out_distances[n_out] = best
+                n_out += 1
+    
+    return out_cards[:n_out], out_distances[:n_out]
@@ -0,0 +1,95 @@
+"""CardMatcher 比對結果的回歸測試"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from src.utils import CardMatcher
+
+CARD_SET = 'hTEST'
+N_PARALLELS = 6
+
+
+def _make_card(rng: np.random.Generator, height: int = 420, width: int = 300) -> np.ndarray:
+    """以隨機的幾何圖形產生一張有足夠紋理讓 ORB 提取特徵的卡片"""
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(80):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        x1, x2 = sorted(int(v) for v in rng.integers(0, width, 2))
+        y1, y2 = sorted(int(v) for v in rng.integers(0, height, 2))
+        if rng.random() < 0.5:
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, int(rng.integers(1, 4)))
+        else:
+            cv2.line(img, (x1, y1), (x2, y2), color, int(rng.integers(1, 4)))
+    return img
+
+
+@pytest.fixture(scope='module')
+def reference_dir(tmp_path_factory):
+    """建立包含多張平行版本（外觀幾乎相同）與其他卡片的參考目錄"""
+    root = tmp_path_factory.mktemp('reference_cards')
+    set_dir = root / CARD_SET
+    set_dir.mkdir()
+
+    base = _make_card(np.random.default_rng(0))
+    for i in range(N_PARALLELS):
+        # 平行版本只有角落的小標記不同
+        card = base.copy()
+        cv2.putText(card, str(i), (270, 410), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+        cv2.imwrite(str(set_dir / f'P-{i}.png'), card)
+    for seed in range(1, 5):
+        cv2.imwrite(str(set_dir / f'X-{seed}.png'), _make_card(np.random.default_rng(seed)))
+    return root, base
+
+
+@pytest.fixture(scope='module')
+def matcher(reference_dir):
+    root, _ = reference_dir
+    return CardMatcher(reference_dir=str(root))
+
+
+def _parallel_ids():
+    return {f'{CARD_SET}/P-{i}' for i in range(N_PARALLELS)}
+
+
+def test_parallels_do_not_split_votes(matcher, reference_dir):
+    """平行版本各自都要得分，不能只有第一張拿到全部的匹配點"""
+    _, base = reference_dir
+    result_ids = {card_id for card_id, _ in matcher.find_matches(base)}
+    assert _parallel_ids() <= result_ids
+
+
+def test_cropped_query_matches_parallel_group(matcher, reference_dir):
+    """裁切過的查詢圖片仍應以平行版本之一為最佳結果"""
+    _, base = reference_dir
+    h, w = base.shape[:2]
+    crop = base[int(h * 0.1):int(h * 0.9), int(w * 0.1):int(w * 0.9)].copy()
+    matches = matcher.find_matches(crop)
+    assert matches
+    assert matches[0][0] in _parallel_ids()
+    assert _parallel_ids() <= {card_id for card_id, _ in matches}
+
+
+@pytest.mark.parametrize('use_numba', [False, True])
+def test_brute_force_equals_per_card_cross_check(matcher, reference_dir, use_numba):
+    """暴力搜尋的結果必須與逐張卡片呼叫 BFMatcher(crossCheck=True) 相同"""
+    if use_numba and matcher._descriptor_words is None:
+        pytest.skip('Numba 未安裝')
+    _, base = reference_dir
+    _, query = matcher._extract_features(base)
+
+    saved_words, saved_batch = matcher._descriptor_words, matcher.MATCH_BATCH_SIZE
+    try:
+        if not use_numba:
+            # 停用 Numba 並縮小批次，讓分批的邊界也被測到
+            matcher._descriptor_words = None
+            matcher.MATCH_BATCH_SIZE = len(query) * 700
+        card_indices, distances = matcher._match_descriptors(query)
+    finally:
+        matcher._descriptor_words, matcher.MATCH_BATCH_SIZE = saved_words, saved_batch
+
+    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+    for index, card_id in enumerate(matcher._card_ids):
+        expected = sorted(m.distance for m in bf.match(query, matcher.reference_cards[card_id]['descriptors']))
+        assert sorted(distances[card_indices == index].tolist()) == expected, card_id
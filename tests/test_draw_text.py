@@ -0,0 +1,39 @@
+"""draw_text 與 cv2.putText 的一致性測試"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from src.utils import draw_text
+
+TEXTS = ['hSD01-001', '/', '%', '50%', 'a/b/c', 'gjpqy', 'W', '98.7%', '卡片', '']
+
+
+@pytest.mark.parametrize('font_scale', [0.5, 1.0, 2.0, 3.5])
+@pytest.mark.parametrize('thickness', [1, 2, 4])
+def test_matches_put_text(font_scale, thickness):
+    """在不同字體大小與粗細下，結果必須與 cv2.putText 逐像素相同"""
+    rng = np.random.default_rng(int(font_scale * 10) + thickness)
+    for text in TEXTS:
+        background = rng.integers(0, 256, (240, 480, 3), dtype=np.uint8)
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        org = (int(rng.integers(10, 200)), int(rng.integers(60, 200)))
+
+        expected = background.copy()
+        cv2.putText(expected, text, org, cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
+        actual = background.copy()
+        draw_text(actual, text, org, font_scale, color, thickness)
+
+        assert np.array_equal(actual, expected), text
+
+
+@pytest.mark.parametrize('org', [(-15, 10), (460, 235), (0, 0), (470, 300)])
+def test_matches_put_text_at_image_edges(org):
+    """文字部分超出圖像時的裁切結果也必須相同"""
+    background = np.zeros((240, 480, 3), dtype=np.uint8)
+    expected = background.copy()
+    cv2.putText(expected, '88/99%', org, cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 255, 0), 2)
+    actual = background.copy()
+    draw_text(actual, '88/99%', org, 2.0, (0, 255, 0), 2)
+    assert np.array_equal(actual, expected)